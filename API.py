@@ -1,82 +1,190 @@
+import asyncio
+import bisect
+import itertools
 import logging
-import copy
-from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
 import httpx
+import orjson
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="MLB Play-by-Play Slicing Simulator")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive client for the app's lifetime so repeat fetches to
+    # statsapi.mlb.com reuse the open TCP/TLS connection.
+    app.state.http = httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        headers={"User-Agent": "HomeRunApple"},
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+
+app = FastAPI(title="MLB Play-by-Play Slicing Simulator", lifespan=lifespan)
+# allPlays JSON is very repetitive, so it compresses well on the wire
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Store game state in memory
 # { 
 #   game_pk: { 
 #     "full_plays": [], 
 #     "total_events": int, 
+#     "cum_events": [],  # cum_events[i] = events in plays[0..i]
 #     "cursor": 0, 
 #     "teams": {"home": str, "away": str}  <-- NEW
 #   } 
 # }
 GAME_SESSIONS: Dict[int, Dict[str, Any]] = {}
 
+# One lock per loaded game so concurrent first hits share a single load_game_session
+SESSION_LOCKS: Dict[int, asyncio.Lock] = {}
+
 MLB_API_BASE = "https://statsapi.mlb.com/api/v1.1/game/{game_pk}/feed/live"
 
+# Parsed sessions of finished games are kept on disk, one file per game_pk.
+# Bump SESSION_SCHEMA_VERSION whenever the cached fields change so stale files are ignored.
+SESSION_CACHE_DIR = Path(__file__).resolve().parent / "cache"
+SESSION_SCHEMA_VERSION = 1
+
+def read_cached_session(game_pk: int) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cached session payload for a game, or None on a miss or stale/corrupt file.
+    """
+    path = SESSION_CACHE_DIR / f"{game_pk}.json"
+    try:
+        payload = orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+    if payload.get("schema_version") != SESSION_SCHEMA_VERSION:
+        return None
+    return payload
+
+def write_cached_session(game_pk: int, payload: Dict[str, Any]):
+    path = SESSION_CACHE_DIR / f"{game_pk}.json"
+    try:
+        SESSION_CACHE_DIR.mkdir(exist_ok=True)
+        # Write then rename so a concurrent reader never sees a partial file
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(orjson.dumps(payload))
+        tmp_path.replace(path)
+    except OSError as e:
+        logger.warning(f"Could not cache session for GamePK {game_pk}: {e}")
+
 async def load_game_session(game_pk: int):
     """
-    Fetches the completed game data once and extracts the list of Play Objects (allPlays) 
+    Loads the game's session, from the disk cache when available. On a miss it fetches the
+    completed game data once and extracts the list of Play Objects (allPlays)
     AND the Home and Away team names.
     """
+    payload = read_cached_session(game_pk)
+    if payload is None:
+        payload = await fetch_game_session(game_pk)
+
+    GAME_SESSIONS[game_pk] = {
+        **payload,
+        "cursor": 0,  # Represents total number of atomic events revealed so far
+    }
+    teams = payload["teams"]
+    logger.info(f"Session loaded. Total atomic events: {payload['total_events']}. Teams: {teams['home']} (H), {teams['away']} (A)")
+
+# Missing fields are rare in MLB feeds, so index directly instead of chaining .get({})
+def extract_plays(full_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    try:
+        return full_data["liveData"]["plays"]["allPlays"]
+    except (KeyError, TypeError):
+        return []
+
+def extract_team_name(full_data: Dict[str, Any], side: str, default: str) -> str:
+    try:
+        return full_data["gameData"]["teams"][side]["name"]
+    except (KeyError, TypeError):
+        return default
+
+async def fetch_game_session(game_pk: int) -> Dict[str, Any]:
+    """
+    Fetches the game from the MLB API and builds the cacheable part of its session.
+    Only finished games are written to the disk cache, since their feed no longer changes.
+    """
     url = MLB_API_BASE.format(game_pk=game_pk)
     logger.info(f"Fetching historical data for GamePK: {game_pk}")
     
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(url)
-        
+    client = app.state.http
+    response = await client.get(url)
+
     if response.status_code != 200:
         raise HTTPException(status_code=404, detail="Game not found")
 
-    full_data = response.json()
+    full_data = orjson.loads(response.content)
     
     # --- 🎯 NEW: Extract Home and Away Team Names ---
-    try:
-        team_data = full_data.get("gameData", {}).get("teams", {})
-        home_team_name = team_data.get("home", {}).get("name", "Unknown Home Team")
-        away_team_name = team_data.get("away", {}).get("name", "Unknown Away Team")
-    except Exception as e:
-        logger.error(f"Could not extract team names: {e}")
-        home_team_name = "Error Fetching Home Team"
-        away_team_name = "Error Fetching Away Team"
+    home_team_name = extract_team_name(full_data, "home", "Unknown Home Team")
+    away_team_name = extract_team_name(full_data, "away", "Unknown Away Team")
     # --------------------------------------------------
     
     # Extract the full list of plays
-    source_plays = full_data.get("liveData", {}).get("plays", {}).get("allPlays", [])
+    source_plays = extract_plays(full_data)
     
+    # Running event count per play, so a cursor maps to its play with a bisect
+    cum_events = list(itertools.accumulate(len(play.get("playEvents", [])) for play in source_plays))
+
     # Calculate total events to set the bounds for our simulation
-    total_events = sum(len(play.get("playEvents", [])) for play in source_plays)
+    total_events = cum_events[-1] if cum_events else 0
 
-    GAME_SESSIONS[game_pk] = {
+    payload = {
+        "schema_version": SESSION_SCHEMA_VERSION,
         "full_plays": source_plays,
         "total_events": total_events,
-        "cursor": 0,  # Represents total number of atomic events revealed so far
+        "cum_events": cum_events,
         "teams": {
             "home": home_team_name,
             "away": away_team_name
         }
     }
-    logger.info(f"Session loaded. Total atomic events: {total_events}. Teams: {home_team_name} (H), {away_team_name} (A)")
+
+    try:
+        game_state = full_data["gameData"]["status"]["abstractGameState"]
+    except (KeyError, TypeError):
+        game_state = None
+    if game_state == "Final":
+        write_cached_session(game_pk, payload)
+
+    return payload
 
 @app.get("/replay/game/{game_pk}/live")
-async def replay_game_plays(game_pk: int, reset: bool = False):
+async def replay_game_plays(request: Request, game_pk: int, reset: bool = False, since: Optional[int] = None):
     """
     Returns an array of Play Objects (simulated allPlays array), 
     where only the current play's playEvents list is growing.
     
     The response now includes the 'teams' object at the root.
+
+    Passing the last seen cursor as `since` returns only the plays that changed after it,
+    starting at 'first_play_index' within the full array.
+
+    The body only depends on the game, cursor and `since`, so it carries an ETag built from
+    them; a matching If-None-Match gets an empty 304 instead.
     """
     # 1. Initialize or Reset
     if reset or game_pk not in GAME_SESSIONS:
-        await load_game_session(game_pk)
+        lock = SESSION_LOCKS.setdefault(game_pk, asyncio.Lock())
+        async with lock:
+            try:
+                # Another request may have loaded the session while we waited
+                if reset or game_pk not in GAME_SESSIONS:
+                    await load_game_session(game_pk)
+            finally:
+                # Only keep locks for games that have a session, so unknown game_pks don't pile up
+                if game_pk not in GAME_SESSIONS and SESSION_LOCKS.get(game_pk) is lock:
+                    del SESSION_LOCKS[game_pk]
     
     session = GAME_SESSIONS[game_pk]
     
@@ -85,38 +193,38 @@ async def replay_game_plays(game_pk: int, reset: bool = False):
         session["cursor"] += 1
     
     current_cursor = session["cursor"]
+
+    etag = f'W/"{game_pk}-{current_cursor}-{"all" if since is None else since}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     
-    # 3. Construct the "Time-Travel" array of plays (Logic remains the same)
+    # 3. Construct the "Time-Travel" array of plays
     source_plays = session["full_plays"]
-    simulated_plays = []
-    events_processed = 0
-    
-    for play in source_plays:
-        events_in_this_play = play.get("playEvents", [])
-        num_events = len(events_in_this_play)
-        
-        # Scenario A: The cursor is past this entire play. (Play is COMPLETE)
-        if events_processed + num_events <= current_cursor:
-            simulated_plays.append(play)
-            events_processed += num_events
-            
-        # Scenario B: The cursor is INSIDE this play. (Play is LIVE)
-        elif events_processed < current_cursor < events_processed + num_events:
-            partial_play = copy.deepcopy(play)
-            
-            # Calculate how many events from this play to show
-            events_to_show = current_cursor - events_processed
-            
-            # Slice the playEvents array to simulate events happening
-            partial_play["playEvents"] = events_in_this_play[:events_to_show]
-            
+    cum_events = session["cum_events"]
+
+    # Scenario A: every play whose events all fall within the cursor is COMPLETE
+    completed = bisect.bisect_right(cum_events, current_cursor)
+
+    # Plays already complete at `since` were sent to the caller before; resend from the one
+    # that was live then, since its playEvents may have grown.
+    first = 0
+    if since is not None:
+        first = bisect.bisect_right(cum_events, min(since, current_cursor))
+
+    simulated_plays = source_plays[first:completed]
+
+    # Scenario B: the cursor is INSIDE the next play (Play is LIVE).
+    # Plays after it haven't started yet.
+    if completed < len(source_plays):
+        events_processed = cum_events[completed - 1] if completed else 0
+        events_to_show = current_cursor - events_processed
+
+        if events_to_show > 0:
+            play = source_plays[completed]
+            # Shallow copy with a sliced playEvents array to simulate events happening.
+            # Only playEvents differs from the source play, so nothing else needs copying.
+            partial_play = {**play, "playEvents": play["playEvents"][:events_to_show]}
             simulated_plays.append(partial_play)
-            # Break here, as future plays haven't started yet
-            break 
-            
-        # Scenario C: The cursor hasn't reached this play yet.
-        else:
-            break
 
     # 4. Final Response Structure
     response_data = {
@@ -124,14 +232,16 @@ async def replay_game_plays(game_pk: int, reset: bool = False):
         "teams": session["teams"], 
         # ----------------------------------------
         "allPlays": simulated_plays,
-        "current_cursor": current_cursor # For debugging
+        "first_play_index": first,
+        "current_cursor": current_cursor # Pass back as `since` on the next poll
     }
 
     # Add the mandatory status flag when exhausted
     if current_cursor >= session["total_events"]:
         response_data["status"] = "COMPLETE"
 
-    return response_data
+    # Serialize allPlays with orjson directly; returning a Response skips FastAPI's encoder
+    return Response(orjson.dumps(response_data), media_type="application/json", headers={"ETag": etag})
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,19 +1,42 @@
 from fastapi import FastAPI, HTTPException
 import httpx
+import orjson
 import asyncio
+import random
 import time
-
-app = FastAPI()
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Optional
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive client shared by every game's poller, instead of a connection pool each
+    app.state.http = httpx.AsyncClient(
+        timeout=10,
+        limits=httpx.Limits(max_keepalive_connections=4, max_connections=20),
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # ---------------- CONFIG ----------------
 REPLAY_HOST = "http://127.0.0.1:8000"
-POLL_INTERVAL = 1  # seconds
+POLL_INTERVAL = 1  # seconds, used while the replay keeps advancing
+MAX_POLL_INTERVAL = 15  # seconds, ceiling while the feed is idle or unreachable
+BACKOFF_FACTOR = 1.5
 
-# Stores latest formatted output per gamePk
-latest_formatted = {}
+# ---------------- STATE ----------------
+@dataclass(slots=True)
+class GameState:
+    last_atbat: int = -1  # Prevent duplicate at-bat processing
+    latest: Optional[dict] = None  # Latest formatted output
+    task: Optional[asyncio.Task] = None  # Background poller
 
-# Prevent duplicate at-bat processing
-last_processed_atbat = {}
+GAMES: dict[int, GameState] = {}
 
 # ---------------- FORMATTER ----------------
 def format_play(play, teams):
@@ -41,57 +64,99 @@ def format_play(play, teams):
     }
 
 # ---------------- BACKGROUND POLLER ----------------
-async def poll_game(gamePk: int):
-    endpoint = f"{REPLAY_HOST}/replay/game/{gamePk}/live"
-    last_processed_atbat[gamePk] = -1
-
-    async with httpx.AsyncClient(timeout=10) as client:
-        while True:
-            try:
-                r = await client.get(endpoint)
-                r.raise_for_status()
-                data = r.json()
-            except Exception:
-                await asyncio.sleep(POLL_INTERVAL)
-                continue
-
-            if data.get("status") == "COMPLETE":
-                break
-
-            plays = data.get("allPlays", [])
-            teams = data.get("teams", {})
-
-            if not plays or not teams:
-                await asyncio.sleep(POLL_INTERVAL)
-                continue
+play_result_and_about = itemgetter("result", "about")
 
-            last_play = plays[-1]
-            result = last_play.get("result")
+def jittered(interval):
+    # +/-20% so several pollers don't hit the replay server in lockstep
+    return interval * (0.8 + 0.4 * random.random())
 
-            if not result:
-                await asyncio.sleep(POLL_INTERVAL)
-                continue
-
-            atbat_index = last_play["about"]["atBatIndex"]
-
-            if atbat_index == last_processed_atbat[gamePk]:
-                await asyncio.sleep(POLL_INTERVAL)
+async def poll_game(gamePk: int):
+    endpoint = f"{REPLAY_HOST}/replay/game/{gamePk}/live"
+    state = GAMES[gamePk]
+    state.last_atbat = -1
+
+    # Poll quickly while the cursor moves, back off while it doesn't
+    interval = POLL_INTERVAL
+    last_cursor = None
+    etag = None
+
+    client = app.state.http
+    while True:
+        try:
+            # Only ask for the plays that changed since the last cursor we saw
+            params = {"since": last_cursor} if last_cursor is not None else None
+            headers = {"If-None-Match": etag} if etag else None
+            r = await client.get(endpoint, params=params, headers=headers)
+
+            # Nothing changed since the last response; treat it like an idle poll
+            if r.status_code == 304:
+                interval = min(interval * BACKOFF_FACTOR, MAX_POLL_INTERVAL)
+                await asyncio.sleep(jittered(interval))
                 continue
 
-            last_processed_atbat[gamePk] = atbat_index
-            latest_formatted[gamePk] = format_play(last_play, teams)
-
-            await asyncio.sleep(POLL_INTERVAL)
+            r.raise_for_status()
+            etag = r.headers.get("ETag")
+            data = orjson.loads(r.content)
+        except Exception:
+            interval = min(interval * BACKOFF_FACTOR, MAX_POLL_INTERVAL)
+            await asyncio.sleep(jittered(interval))
+            continue
+
+        if data.get("status") == "COMPLETE":
+            break
+
+        cursor = data.get("current_cursor")
+        if cursor != last_cursor:
+            # The replay was reset, so its at-bats start over from the beginning
+            if last_cursor is not None and cursor is not None and cursor < last_cursor:
+                state.last_atbat = -1
+            last_cursor = cursor
+            interval = POLL_INTERVAL
+        else:
+            interval = min(interval * BACKOFF_FACTOR, MAX_POLL_INTERVAL)
+
+        plays = data.get("allPlays", [])
+        teams = data.get("teams", {})
+
+        if not plays or not teams:
+            await asyncio.sleep(jittered(interval))
+            continue
+
+        last_play = plays[-1]
+        try:
+            result, about = play_result_and_about(last_play)
+            atbat_index = about["atBatIndex"]
+        except KeyError:
+            result = None
+
+        if not result:
+            await asyncio.sleep(jittered(interval))
+            continue
+
+        # atBatIndex only grows during a replay, so anything not newer has been handled
+        if atbat_index <= state.last_atbat:
+            await asyncio.sleep(jittered(interval))
+            continue
+
+        state.last_atbat = atbat_index
+        state.latest = format_play(last_play, teams)
+
+        await asyncio.sleep(jittered(interval))
 
 # ---------------- API ENDPOINT ----------------
 @app.get("/formatted/game/{gamePk}")
 async def get_formatted_game(gamePk: int):
-    # Start polling if not already running
-    if gamePk not in latest_formatted:
-        asyncio.create_task(poll_game(gamePk))
+    state = GAMES.setdefault(gamePk, GameState())
+
+    # Start polling if no poller is running yet. Checking the task rather than the output
+    # keeps a burst of requests before the first at-bat from each spawning its own poller.
+    if state.latest is None and (state.task is None or state.task.done()):
+        state.task = asyncio.create_task(poll_game(gamePk))
+
+    if state.latest is None:
         return {
             "status": "INITIALIZING",
             "message": "Waiting for first completed at-bat"
         }
 
-    return latest_formatted[gamePk]
+    return state.latest